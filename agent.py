@@ -8,6 +8,7 @@ An Email Agent with LangChain + LangGraph + Gmail API
 """
 
 import os
+from pathlib import Path
 from typing import Annotated, Literal, Sequence
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
@@ -22,39 +23,17 @@ from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage
 from langchain_core.tools import tool
 
 # Gmail API imports
-import base64
-import os.path
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from email.mime.text import MIMEText
+from my_agent.utils.gmail_client import batch_get_messages, get_service
 
 # Load .env file for OpenAI key
-load_dotenv("credentials/.env")
+load_dotenv(Path(__file__).resolve().parent / "credentials" / ".env")
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
 if not openai_api_key:
     raise ValueError("OPENAI_API_KEY is not set. Please check your .env file.")
 
 # --- Gmail API setup ---
-SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
-
-def get_gmail_service():
-    creds = None
-    if os.path.exists("credentials\\token.json"):
-        creds = Credentials.from_authorized_user_file("credentials\\token.json", SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file("credentials\\credentials.json", SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open("credentials\\token.json", "w") as token:
-            token.write(creds.to_json())
-    return build("gmail", "v1", credentials=creds)
-
-gmail_service = get_gmail_service()
+gmail_service = get_service()
 
 # --- LangGraph Agent ---
 
@@ -71,12 +50,11 @@ def get_all_emails():
     """Fetch the latest emails from Gmail inbox"""
     results = gmail_service.users().messages().list(userId="me", maxResults=10, labelIds=["INBOX"]).execute()
     messages = results.get("messages", [])
-    email_data = []
-    for msg in messages:
-        msg_obj = gmail_service.users().messages().get(userId="me", id=msg["id"]).execute()
-        snippet = msg_obj.get("snippet", "")
-        email_data.append(snippet)
-    return email_data
+    msg_objs = batch_get_messages(
+        gmail_service, [msg["id"] for msg in messages],
+        format="metadata", metadataHeaders=["Subject", "From"]
+    )
+    return [msg_obj.get("snippet", "") for msg_obj in msg_objs]
 
 @tool
 def identify_important_unanswered_email():
@@ -85,12 +63,11 @@ def identify_important_unanswered_email():
     messages = results.get("messages", [])
     if not messages:
         return "No unread emails."
-    unread_data = []
-    for msg in messages:
-        msg_obj = gmail_service.users().messages().get(userId="me", id=msg["id"]).execute()
-        snippet = msg_obj.get("snippet", "")
-        unread_data.append(snippet)
-    return unread_data
+    msg_objs = batch_get_messages(
+        gmail_service, [msg["id"] for msg in messages],
+        format="metadata", metadataHeaders=["Subject", "From"]
+    )
+    return [msg_obj.get("snippet", "") for msg_obj in msg_objs]
 
 @tool
 def propose_draft_response(to: str, subject: str, body: str):
@@ -109,9 +86,10 @@ tools = [identify_important_unanswered_email, get_all_emails, propose_draft_resp
 
 model = ChatOpenAI(model="gpt-4o-mini", temperature=0.2, api_key=openai_api_key).bind_tools(tools)
 
+SYSTEM_PROMPT = SystemMessage(content="You are my AI email assistant. Help me read, summarize,identify important unanswered emails, and propose a draft response to Gmail messages.")
+
 def model_call(state: AgentState) -> AgentState:
-    system_prompt = SystemMessage(content="You are my AI email assistant. Help me read, summarize,identify important unanswered emails, and propose a draft response to Gmail messages.")
-    response = model.invoke([system_prompt] + state["messages"])
+    response = model.invoke([SYSTEM_PROMPT] + state["messages"])
     return {"messages": [response]}
 
 def should_continue(state: AgentState):
@@ -141,6 +119,7 @@ def print_stream(stream):
         except AttributeError:
             print(message)
 
-# Example: fetch unread emails
-inputs = {"messages": [HumanMessage(content="Check my unread emails and give me an email which needs reply")]}
-print_stream(app.stream(inputs, stream_mode="values"))
+if __name__ == "__main__":
+    # Example: fetch unread emails
+    inputs = {"messages": [HumanMessage(content="Check my unread emails and give me an email which needs reply")]}
+    print_stream(app.stream(inputs, stream_mode="values"))
@@ -8,118 +8,264 @@ An Email Agent with LangChain + LangGraph + Gmail API
 - Send reply if needed
 """
 
+import argparse
+import asyncio
+import json
 import os
+from pathlib import Path
 from dotenv import load_dotenv
-import base64
+import hashlib
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import wraps
 from typing import TypedDict, Optional
 from email.mime.text import MIMEText
 
+import numpy as np
+from aiolimiter import AsyncLimiter
+
 # --- Gmail API ---
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from my_agent.utils.gmail_client import (
+    authorized_http, encode_message, extract_headers, fetch_new_unread_messages, get_service, is_automated,
+    save_cursor
+)
 
 # --- LangChain / LangGraph ---
-from langchain_openai import ChatOpenAI
+from openai import OpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain.tools import tool
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
 
 # --------------------------------------------------
 # Gmail Setup
 # --------------------------------------------------
-SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
-
 # Load the .env file for credentials
-load_dotenv('..\\credentials\\.env')
+load_dotenv(Path(__file__).resolve().parent.parent / "credentials" / ".env")
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
 if not openai_api_key:
     raise ValueError("OPENAI_API_KEY is not set. Please check your .env file.")
 
 
-def get_gmail_service():
-    creds = None
-    if os.path.exists("..\\credentials\\token.json"):
-        creds = Credentials.from_authorized_user_file("..\\credentials\\token.json", SCOPES)
-    if not creds or not creds.valid:
-        flow = InstalledAppFlow.from_client_secrets_file("..\\credentials\\credentials.json", SCOPES)
-        creds = flow.run_local_server(port=0)
-        with open("..\\credentials\\token.json", "w") as token:
-            token.write(creds.to_json())
-    return build("gmail", "v1", credentials=creds)
+# --------------------------------------------------
+# LLM Clients
+# --------------------------------------------------
+# One shared client (and connection pool) for every LLM tool
+llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.2, api_key=openai_api_key)
+reply_llm = llm.bind(temperature=0.4)
+embeddings = OpenAIEmbeddings(model="text-embedding-3-small", api_key=openai_api_key)
+
+# Keep parallel runs under OpenAI's limits instead of triggering 429 retry storms
+LLM_MAX_CONCURRENCY = 10
+LLM_REQUESTS_PER_MINUTE = 500
+# Both primitives bind to the loop they first wait on, and callers may start a fresh
+# asyncio.run() each time, so keep one (Semaphore, AsyncLimiter) pair per event loop
+_llm_gates = weakref.WeakKeyDictionary()
+
+
+@asynccontextmanager
+async def openai_slot():
+    """Hold one slot of the shared concurrency cap and requests-per-minute budget."""
+    loop = asyncio.get_running_loop()
+    if loop not in _llm_gates:
+        _llm_gates[loop] = (
+            asyncio.Semaphore(LLM_MAX_CONCURRENCY),
+            AsyncLimiter(max_rate=LLM_REQUESTS_PER_MINUTE, time_period=60),
+        )
+    semaphore, rate_limiter = _llm_gates[loop]
+    async with semaphore, rate_limiter:
+        yield
+
+
+async def gated_invoke(model, messages):
+    """Invoke `model` within the shared OpenAI concurrency and rate limits."""
+    async with openai_slot():
+        return await model.ainvoke(messages)
+
+
+# --------------------------------------------------
+# Semantic Cache
+# --------------------------------------------------
+EMBEDDING_CACHE_SIZE = 1024
+_email_embeddings = OrderedDict()  # content hash -> task resolving to a normalized embedding
+
+
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+async def _embed(email: str):
+    async with openai_slot():
+        vector = np.asarray(await embeddings.aembed_query(email))
+    return vector / np.linalg.norm(vector)
+
+
+async def embed_email(key: str, email: str):
+    """Embed an email once per content hash, shared by every cached tool (even concurrent ones)."""
+    task = _email_embeddings.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_embed(email))
+        _email_embeddings[key] = task
+        if len(_email_embeddings) > EMBEDDING_CACHE_SIZE:
+            _email_embeddings.popitem(last=False)
+    try:
+        return await task
+    except BaseException:
+        if _email_embeddings.get(key) is task:
+            del _email_embeddings[key]
+        raise
+
+
+def semantic_cache(ttl: int = 86400, threshold: float = 0.97, maxsize: int = 1024, match_similar: bool = True):
+    """Reuse a tool's result for emails whose embedding is within `threshold`
+    cosine similarity of one answered in the last `ttl` seconds.
+
+    Byte-identical emails (reply-all threads, notifications) are answered from an
+    exact-match table keyed on the content hash, before any embedding call; concurrent
+    identical calls share one in-flight lookup. With `match_similar=False` only that
+    exact-match table is used."""
+    def decorator(func):
+        exact = OrderedDict()  # content hash -> (expires_at, task resolving to the result), least recent first
+        entries = []  # (expires_at, normalized embedding, result), oldest first
+
+        async def lookup(key: str, email: str, now: float) -> str:
+            if match_similar:
+                entries[:] = [entry for entry in entries if entry[0] > now]
+                vector = await embed_email(key, email)
+                if entries:
+                    similarities = np.stack([entry[1] for entry in entries]) @ vector
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= threshold:
+                        return entries[best][2]
+
+            result = await func(email)
+            if match_similar:
+                entries.append((now + ttl, vector, result))
+                del entries[:-maxsize]
+            return result
+
+        @wraps(func)
+        async def wrapper(email: str) -> str:
+            now = time.monotonic()
+            key = content_hash(email)
+            hit = exact.get(key)
+            if hit and hit[0] > now:
+                exact.move_to_end(key)
+                task = hit[1]
+            else:
+                # Register the task before awaiting it so identical emails running
+                # concurrently wait for this call instead of starting their own
+                task = asyncio.ensure_future(lookup(key, email, now))
+                exact[key] = (now + ttl, task)
+                if len(exact) > maxsize:
+                    exact.popitem(last=False)
+            try:
+                return await task
+            except BaseException:
+                # Don't cache failures (or cancellations); the next call retries
+                if exact.get(key, (None, None))[1] is task:
+                    del exact[key]
+                raise
+        return wrapper
+    return decorator
 
 
 # --------------------------------------------------
 # Tools
 # --------------------------------------------------
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You summarize emails clearly."),
+    ("human", "Summarize this email in 3 concise bullet points:\n{email}")
+])
+CHECK_REPLY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Decide if the email needs a reply. Answer 'YES' or 'NO'."),
+    ("human", "Email:\n{email}")
+])
+REPLY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a polite assistant drafting professional replies."),
+    ("human", "Draft a reply for this email:\n{email}")
+])
+
+
 @tool("summarize_email", return_direct=False)
-def summarize_email_tool(email: str) -> str:
+@semantic_cache(ttl=86400)
+async def summarize_email_tool(email: str) -> str:
     """Summarize an email in 3 concise bullet points."""
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.2, api_key=openai_api_key)
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You summarize emails clearly."),
-        ("human", "Summarize this email in 3 concise bullet points:\n{email}")
-    ])
-    result = llm.invoke(prompt.format(email=email))
+    result = await gated_invoke(llm, SUMMARY_PROMPT.format_messages(email=email))
     return result.content.strip()
 
 
 @tool("check_reply", return_direct=False)
-def check_reply_tool(email: str) -> str:
+@semantic_cache(ttl=86400)
+async def check_reply_tool(email: str) -> str:
     """Check if an email requires a reply. Returns 'YES' or 'NO'."""
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.2, api_key=openai_api_key)
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "Decide if the email needs a reply."),
-        ("human", "Email:\n{email}\nAnswer 'YES' or 'NO'.")
-    ])
-    result = llm.invoke(prompt.format(email=email))
+    result = await gated_invoke(llm, CHECK_REPLY_PROMPT.format_messages(email=email))
     return result.content.strip()
 
 
+# Replies are sent automatically, so never reuse one written for a merely similar
+# email (e.g. the same text signed by someone else)
 @tool("generate_reply", return_direct=False)
-def generate_reply_tool(email: str) -> str:
+@semantic_cache(ttl=86400, match_similar=False)
+async def generate_reply_tool(email: str) -> str:
     """Generate a draft reply for the email if a reply is needed."""
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.4, api_key=openai_api_key)
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a polite assistant drafting professional replies."),
-        ("human", "Draft a reply for this email:\n{email}")
-    ])
-    result = llm.invoke(prompt.format(email=email))
+    result = await gated_invoke(reply_llm, REPLY_PROMPT.format_messages(email=email))
     return result.content.strip()
 
 
 @tool("send_email", return_direct=False)
 def send_email_tool(recipient: str, subject: str, body: str) -> str:
     """Send an email via Gmail API."""
-    service = get_gmail_service()
+    service = get_service()
     message = MIMEText(body)
     message["to"] = recipient
     message["subject"] = subject
 
-    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode("utf-8")
-    send_message = {"raw": raw_message}
-    service.users().messages().send(userId="me", body=send_message).execute()
+    send_message = {"raw": encode_message(message)}
+    # Sends run in LangGraph's worker threads; httplib2 is not thread-safe, so don't share the service's session
+    service.users().messages().send(userId="me", body=send_message).execute(http=authorized_http())
     return f"Email sent to {recipient} with subject '{subject}'."
 
 
-@tool("fetch_unread_emails", return_direct=False)
-def fetch_unread_emails_tool(max_results: int = 5) -> list:
-    """Fetch unread emails (snippet + sender + subject)."""
-    service = get_gmail_service()
-    results = service.users().messages().list(
-        userId="me", labelIds=["INBOX", "UNREAD"], maxResults=max_results
-    ).execute()
-    messages = results.get("messages", [])
+# Gmail history cursor, so repeat fetches only ask for mail that arrived since the last one
+HISTORY_FILE = Path(__file__).resolve().parent.parent / ".state" / "gmail_history"
+
+
+def fetch_unread_emails(max_results: int = 5):
+    """Return up to `max_results` unread emails that arrived since the last processed
+    fetch, and the history cursor to pass to save_cursor() once they are handled."""
+    msgs_data, cursor = fetch_new_unread_messages(
+        get_service(), HISTORY_FILE, max_results, ["Subject", "From", "List-Unsubscribe"]
+    )
 
     emails = []
-    for msg in messages:
-        msg_data = service.users().messages().get(userId="me", id=msg["id"]).execute()
-        headers = msg_data["payload"]["headers"]
-        subject = next(h["value"] for h in headers if h["name"] == "Subject")
-        sender = next(h["value"] for h in headers if h["name"] == "From")
+    for msg_data in msgs_data:
+        headers = extract_headers(msg_data["payload"].get("headers", []), ["Subject", "From", "List-Unsubscribe"])
         snippet = msg_data.get("snippet", "")
-        emails.append({"id": msg["id"], "subject": subject, "sender": sender, "snippet": snippet})
+        emails.append({
+            "id": msg_data["id"],
+            "subject": headers["Subject"],
+            "sender": headers["From"],
+            "snippet": snippet,
+            "labels": msg_data.get("labelIds", []),
+            "list_unsubscribe": headers["List-Unsubscribe"],
+        })
+    return emails, cursor
+
+
+@tool("fetch_unread_emails", return_direct=False)
+def fetch_unread_emails_tool(max_results: int = 5) -> list:
+    """Fetch unread emails (snippet + sender + subject + labels) that arrived since the last fetch.
+
+    Noreply senders and promotional/social mail are skipped.
+    """
+    emails, cursor = fetch_unread_emails(max_results)
+    # The caller takes it from here, so count the emails as handled once returned
+    save_cursor(HISTORY_FILE, cursor, [email["id"] for email in emails])
     return emails
 
 
@@ -134,23 +280,51 @@ class EmailState(TypedDict):
     needs_reply: Optional[bool]
     draft_reply: Optional[str]
     status: Optional[str]
+    labels: Optional[list[str]]
+    list_unsubscribe: Optional[str]
+
+
+def is_bulk_email(state: EmailState) -> bool:
+    """Mailing lists, automated senders and promotional/social mail never need a reply."""
+    if state.get("list_unsubscribe"):
+        return True
+    return is_automated(state["recipient"], state.get("labels") or [])
+
+
+def to_email_state(email: dict) -> EmailState:
+    """Build the workflow input for a fetch_unread_emails_tool or read_email.py result."""
+    return {
+        "email": email["snippet"],
+        # read_email.py stores the sender under "from"
+        "recipient": email.get("sender") or email.get("from", ""),
+        "subject": email["subject"],
+        "labels": email.get("labels", []),
+        "list_unsubscribe": email.get("list_unsubscribe", ""),
+    }
+
 
+def dispatch_email(state: EmailState):
+    # summarize and check_reply only read the email, so fan them out in parallel
+    return [Send("summarize", state), Send("check_reply", state)]
 
-def summarize_node(state: EmailState):
-    summary = summarize_email_tool.invoke({"email": state["email"]})
+
+async def summarize_node(state: EmailState):
+    summary = await summarize_email_tool.ainvoke({"email": state["email"]})
     return {"summary": summary}
 
 
-def check_reply_node(state: EmailState):
-    result = check_reply_tool.invoke({"email": state["email"]})
+async def check_reply_node(state: EmailState):
+    if is_bulk_email(state):
+        return {"needs_reply": False}
+    result = await check_reply_tool.ainvoke({"email": state["email"]})
     needs_reply = "YES" in result.upper()
     return {"needs_reply": needs_reply}
 
 
-def generate_reply_node(state: EmailState):
+async def generate_reply_node(state: EmailState):
     if not state["needs_reply"]:
         return {"draft_reply": None}
-    result = generate_reply_tool.invoke({"email": state["email"]})
+    result = await generate_reply_tool.ainvoke({"email": state["email"]})
     return {"draft_reply": result}
 
 
@@ -171,18 +345,117 @@ workflow.add_node("check_reply", check_reply_node)
 workflow.add_node("generate_reply", generate_reply_node)
 workflow.add_node("send_email", send_email_node)
 
-workflow.set_entry_point("summarize")
-workflow.add_edge("summarize", "check_reply")
-workflow.add_edge("check_reply", "generate_reply")
+workflow.add_conditional_edges(START, dispatch_email, ["summarize", "check_reply"])
+workflow.add_edge(["summarize", "check_reply"], "generate_reply")
 workflow.add_edge("generate_reply", "send_email")
 workflow.add_edge("send_email", END)
 
 app = workflow.compile()
 
+
+async def process_emails(states: list[EmailState], max_concurrency: int = 10,
+                         return_exceptions: bool = False) -> list[EmailState]:
+    """Run the workflow for several emails concurrently so their LLM calls overlap.
+
+    At most `max_concurrency` emails are in flight to stay within OpenAI rate limits.
+    With `return_exceptions`, an email whose run failed gets its exception in place
+    of a result, as with asyncio.gather.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(state: EmailState) -> EmailState:
+        async with semaphore:
+            return await app.ainvoke(state)
+
+    return await asyncio.gather(*(run(state) for state in states), return_exceptions=return_exceptions)
+
+
+async def process_unread_emails(max_results: int = 5) -> list[EmailState]:
+    """Fetch unread emails and run each through the workflow.
+
+    The history cursor only moves past these emails once all of them were processed;
+    if any run fails, the successful ones are recorded as handled and the rest are
+    fetched again on the next call.
+    """
+    emails, cursor = await asyncio.to_thread(fetch_unread_emails, max_results)
+    results = await process_emails([to_email_state(email) for email in emails], return_exceptions=True)
+    handled = [email["id"] for email, result in zip(emails, results) if not isinstance(result, BaseException)]
+    failures = [result for result in results if isinstance(result, BaseException)]
+    save_cursor(HISTORY_FILE, None if failures else cursor, handled)
+    if failures:
+        raise failures[0]
+    return results
+
+
+# --------------------------------------------------
+# Batch Mode
+# --------------------------------------------------
+BATCH_TASKS = {"summary": SUMMARY_PROMPT, "needs_reply": CHECK_REPLY_PROMPT}
+OPENAI_ROLES = {"system": "system", "human": "user"}
+
+
+def batch_process_emails(emails: list[dict], poll_interval: int = 60) -> dict:
+    """Summarize and classify emails through the OpenAI Batch API.
+
+    Meant for non-interactive sweeps of read_email.py output: results arrive
+    within 24h at half the real-time price. Returns {email id: {"summary", "needs_reply"}};
+    a request that failed leaves its key out and its reason in the email's "errors" dict.
+    """
+    client = OpenAI(api_key=openai_api_key)
+    results = {email["id"]: {} for email in emails}
+    requests = []
+    for email in emails:
+        tasks = dict(BATCH_TASKS)
+        # Bulk mail never needs a reply; only ask the model to summarize it
+        if is_bulk_email(to_email_state(email)):
+            del tasks["needs_reply"]
+            results[email["id"]]["needs_reply"] = False
+        for task, prompt in tasks.items():
+            messages = prompt.format_messages(email=email["snippet"])
+            requests.append(json.dumps({
+                "custom_id": f"{email['id']}:{task}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": llm.model_name,
+                    "temperature": llm.temperature,
+                    "messages": [{"role": OPENAI_ROLES[m.type], "content": m.content} for m in messages],
+                },
+            }))
+
+    batch_file = client.files.create(file=("emails.jsonl", "\n".join(requests).encode("utf-8")), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h"
+    )
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id)
+    if batch.status != "completed":
+        raise RuntimeError(f"OpenAI batch {batch.id} finished with status '{batch.status}'.")
+
+    # Successful requests land in the output file, failed ones in the error file
+    lines = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            lines.extend(client.files.content(file_id).text.splitlines())
+    for line in lines:
+        record = json.loads(line)
+        email_id, task = record["custom_id"].rsplit(":", 1)
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            error = record.get("error") or response.get("body", {}).get("error") or {}
+            reason = error.get("message") or f"HTTP {response.get('status_code')}"
+            results[email_id].setdefault("errors", {})[task] = reason
+            continue
+        content = response["body"]["choices"][0]["message"]["content"].strip()
+        results[email_id][task] = "YES" in content.upper() if task == "needs_reply" else content
+    return results
+
+
 # --------------------------------------------------
 # Example Run
 # --------------------------------------------------
-if __name__ == "__main__":
+async def main():
     email_text = """
     Hi John, 
 
@@ -192,12 +465,34 @@ if __name__ == "__main__":
     Thanks,
     Sarah
     """
-    result = app.invoke({
+    [result] = await process_emails([{
         "email": email_text,
         "recipient": "sarah@example.com",
         "subject": "Project update reminder"
-    })
+    }])
 
     print("📌 Summary:", result["summary"])
     print("📌 Draft Reply:", result["draft_reply"])
     print("📌 Status:", result["status"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-file", type=str, default=None,
+                        help="JSON output of read_email.py to process with the OpenAI Batch API")
+    parser.add_argument("--unread", type=int, default=0,
+                        help="Fetch this many unread emails from Gmail and run them through the workflow")
+    args = parser.parse_args()
+
+    if args.batch_file:
+        with open(args.batch_file, "r", encoding="utf-8") as f:
+            emails = json.load(f)
+        for email_id, outcome in batch_process_emails(emails).items():
+            print(f"📌 {email_id}:", outcome)
+    elif args.unread:
+        for result in asyncio.run(process_unread_emails(args.unread)):
+            print("📌 Subject:", result["subject"])
+            print("📌 Summary:", result["summary"])
+            print("📌 Status:", result["status"])
+    else:
+        asyncio.run(main())
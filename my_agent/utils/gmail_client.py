@@ -0,0 +1,237 @@
+"""
+gmail_client.py
+Shared Gmail API client used by the agents and scripts.
+- OAuth token loading / refresh
+- One process-wide set of credentials and Gmail service
+- Batch message fetching and header helpers
+- Incremental unread fetching through a history cursor
+- Raw message encoding for sends
+"""
+
+import binascii
+import io
+import json
+import threading
+from email.generator import BytesGenerator
+from email.message import Message
+from pathlib import Path
+from typing import Optional
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import Resource, build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
+
+# If modifying these scopes, delete the file token.json.
+SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
+
+CREDENTIALS_DIR = Path(__file__).resolve().parents[2] / "credentials"
+TOKEN_FILE = CREDENTIALS_DIR / "token.json"
+CLIENT_SECRETS_FILE = CREDENTIALS_DIR / "credentials.json"
+
+# Gmail accepts at most 100 calls per batch request
+BATCH_SIZE = 100
+
+# Automated senders and Gmail categories that never need a reply
+NOREPLY_MARKERS = ("noreply", "no-reply", "donotreply", "do-not-reply")
+BULK_LABELS = {"CATEGORY_PROMOTIONS", "CATEGORY_SOCIAL"}
+# Server-side form of is_automated(), for messages().list
+UNREAD_QUERY = "-from:noreply -from:no-reply -from:donotreply -from:do-not-reply -category:promotions -category:social"
+
+# Ids of messages already processed, kept in the cursor file so mail listed on the first
+# call (or before a failed run) isn't returned again when history is re-read
+HANDLED_IDS_KEPT = 1000
+
+# Standard -> URL-safe base64 alphabet
+_URLSAFE_ALPHABET = bytes.maketrans(b"+/", b"-_")
+
+
+_creds: Optional[Credentials] = None
+_service: Optional[Resource] = None
+_service_creds: Optional[Credentials] = None
+# Sends call get_credentials() from worker threads; one refresh and token.json write at a time
+_auth_lock = threading.RLock()
+
+
+def get_credentials() -> Credentials:
+    """Return the process-wide OAuth credentials.
+
+    token.json is read only on first use and written back only when the token
+    is refreshed or re-issued, so valid credentials cost no disk I/O.
+    """
+    global _creds
+    with _auth_lock:
+        if _creds is None and TOKEN_FILE.exists():
+            _creds = Credentials.from_authorized_user_file(str(TOKEN_FILE), SCOPES)
+        if not _creds or not _creds.valid:
+            if _creds and _creds.expired and _creds.refresh_token:
+                _creds.refresh(Request())
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file(str(CLIENT_SECRETS_FILE), SCOPES)
+                _creds = flow.run_local_server(port=0)
+            TOKEN_FILE.write_text(_creds.to_json())
+        return _creds
+
+
+def authorized_http() -> AuthorizedHttp:
+    """Return a new authorized HTTP session with googleapiclient's default settings.
+
+    httplib2 sessions are not thread-safe: code calling the API from worker threads
+    should pass its own session to `.execute(http=...)` instead of sharing the service's.
+    """
+    return AuthorizedHttp(get_credentials(), http=build_http())
+
+
+def get_service() -> Resource:
+    """Return the process-wide Gmail API client, authenticating on first use."""
+    global _service, _service_creds
+    with _auth_lock:
+        creds = get_credentials()
+        # Refreshes update the credentials in place; only a re-issued token needs a new client
+        if _service is None or _service_creds is not creds:
+            # Use the discovery document bundled with google-api-python-client instead of fetching it
+            _service = build("gmail", "v1", http=authorized_http(), static_discovery=True, cache_discovery=False)
+            _service_creds = creds
+        return _service
+
+
+def batch_get_messages(service, message_ids, **params):
+    """Fetch messages with Gmail batch requests, keeping the order of message_ids.
+
+    Messages deleted since their id was listed (404) are skipped.
+    """
+    responses = {}
+
+    def collect(request_id, response, exception):
+        if isinstance(exception, HttpError) and exception.resp.status == 404:
+            return
+        if exception is not None:
+            raise exception
+        responses[request_id] = response
+
+    for start in range(0, len(message_ids), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=collect)
+        for msg_id in message_ids[start:start + BATCH_SIZE]:
+            batch.add(service.users().messages().get(userId="me", id=msg_id, **params), request_id=msg_id)
+        batch.execute()
+    return [responses[msg_id] for msg_id in message_ids if msg_id in responses]
+
+
+def extract_headers(headers, names):
+    """Map each requested header name to its value ("" if missing) in one pass."""
+    values = {h["name"]: h["value"] for h in headers}
+    return {name: values.get(name, "") for name in names}
+
+
+def is_automated(sender: str, labels) -> bool:
+    """True for noreply senders and promotional/social mail, the mail UNREAD_QUERY excludes."""
+    return any(marker in sender.lower() for marker in NOREPLY_MARKERS) or bool(BULK_LABELS.intersection(labels))
+
+
+def _is_wanted(msg_data) -> bool:
+    labels = msg_data.get("labelIds", [])
+    sender = extract_headers(msg_data["payload"].get("headers", []), ["From"])["From"]
+    return "UNREAD" in labels and not is_automated(sender, labels)
+
+
+def _unread_history(service, start_history_id: str):
+    """Return [(history record id, added unread inbox message ids)] after start_history_id,
+    oldest first, and the mailbox's latest historyId."""
+    records, page_token = [], None
+    while True:
+        response = service.users().history().list(
+            userId="me", startHistoryId=start_history_id, historyTypes=["messageAdded"],
+            labelId="INBOX", pageToken=page_token
+        ).execute()
+        for record in response.get("history", []):
+            added = record.get("messagesAdded", [])
+            records.append((record["id"], [a["message"]["id"] for a in added
+                                           if "UNREAD" in a["message"].get("labelIds", [])]))
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return records, response["historyId"]
+
+
+def load_cursor(cursor_file: Path):
+    """Return the saved (historyId or None, handled message ids) from `cursor_file`."""
+    if not cursor_file.exists():
+        return None, []
+    text = cursor_file.read_text().strip()
+    if text.isdigit():  # plain historyId written by older versions
+        return text, []
+    state = json.loads(text)
+    return state.get("history_id"), state.get("handled", [])
+
+
+def save_cursor(cursor_file: Path, history_id=None, handled_ids=()) -> None:
+    """Save the history cursor and add `handled_ids` to the handled message ids.
+
+    A `history_id` of None keeps the saved one, so callers can record progress
+    without moving the cursor past mail that still needs processing.
+    """
+    saved_id, handled = load_cursor(cursor_file)
+    handled = list(dict.fromkeys([*handled, *handled_ids]))[-HANDLED_IDS_KEPT:]
+    cursor_file.parent.mkdir(parents=True, exist_ok=True)
+    cursor_file.write_text(json.dumps({"history_id": history_id or saved_id, "handled": handled}))
+
+
+def fetch_new_unread_messages(service, cursor_file: Path, max_results: int, metadata_headers):
+    """Return metadata for up to `max_results` unread inbox messages not yet handled,
+    oldest first, skipping mail that is_automated() flags, and the cursor to save once
+    they are processed.
+
+    The cursor file is only read: pass the returned cursor and the processed ids to
+    save_cursor() afterwards, so a failed run is fetched again. Later calls only read
+    history after the saved historyId. The cursor stops at the last history record
+    whose messages were all returned, so mail beyond `max_results` comes back on the
+    next call (a single record adding more than `max_results` messages is returned whole).
+
+    The first call, or one whose cursor has expired, lists the newest `max_results`
+    unread messages instead. Older unread mail is never returned: the cursor starts at
+    the current historyId. Mail arriving while listing can show up in both the list and
+    the following history; the handled ids saved with the cursor filter it out.
+    """
+    params = {"format": "metadata", "metadataHeaders": list(dict.fromkeys(["From", *metadata_headers]))}
+    start, handled = load_cursor(cursor_file)
+    handled = set(handled)
+    if start:
+        try:
+            records, latest = _unread_history(service, start)
+        except HttpError as err:
+            # Gmail keeps about a week of history; 404 means the cursor expired
+            if err.resp.status != 404:
+                raise
+        else:
+            ids = list(dict.fromkeys(msg_id for _, record_ids in records for msg_id in record_ids
+                                     if msg_id not in handled))
+            fetched = {msg["id"]: msg for msg in batch_get_messages(service, ids, **params)}
+            messages, seen, cursor = [], set(handled), start
+            for record_id, record_ids in records:
+                wanted = [fetched[i] for i in record_ids
+                          if i in fetched and i not in seen and _is_wanted(fetched[i])]
+                if messages and len(messages) + len(wanted) > max_results:
+                    break
+                messages.extend(wanted)
+                seen.update(record_ids)
+                cursor = record_id
+            else:
+                cursor = latest
+            return messages, cursor
+
+    cursor = service.users().getProfile(userId="me").execute()["historyId"]
+    results = service.users().messages().list(
+        userId="me", labelIds=["INBOX", "UNREAD"], q=UNREAD_QUERY, maxResults=max_results
+    ).execute()
+    listed_ids = [msg["id"] for msg in results.get("messages", []) if msg["id"] not in handled]
+    listed = batch_get_messages(service, listed_ids, **params)
+    return [msg for msg in reversed(listed) if _is_wanted(msg)][:max_results], cursor
+
+
+def encode_message(message: Message) -> str:
+    """Serialize a MIME message into the base64url `raw` string Gmail expects."""
+    buffer = io.BytesIO()
+    BytesGenerator(buffer, mangle_from_=False).flatten(message)
+    return binascii.b2a_base64(buffer.getvalue(), newline=False).translate(_URLSAFE_ALPHABET).decode("ascii")
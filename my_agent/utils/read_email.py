@@ -1,34 +1,14 @@
 from __future__ import print_function
-import os
-import json
 import datetime
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import orjson
+from pathlib import Path
 
-# If modifying these scopes, delete the file token.json.
-SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+from my_agent.utils.gmail_client import extract_headers, get_service
 
-def main():
-    creds = None
-    # Load token.json if it exists
-    if os.path.exists('..\\..\\credentials\\token.json'):
-        creds = Credentials.from_authorized_user_file('..\\..\\credentials\\token.json', SCOPES)
-    # If no valid credentials, authenticate
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                '..\\..\\credentials\\credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save credentials for later use
-        with open('..\\..\\credentials\\token.json', 'w') as token:
-            token.write(creds.to_json())
+DATA_DIR = Path(__file__).resolve().parents[2] / "data"
 
-    # Build Gmail API service
-    service = build('gmail', 'v1', credentials=creds)
+def main():
+    service = get_service()
 
     # Today's date in YYYY/MM/DD for Gmail query
     today = datetime.date.today().strftime("%Y/%m/%d")
@@ -53,29 +33,35 @@ def main():
     else:
         print(f"Found {len(messages)} emails today.\n")
         for msg in messages:
-            msg_data = service.users().messages().get(userId='me', id=msg['id']).execute()
+            msg_data = service.users().messages().get(
+                userId='me', id=msg['id'],
+                format='metadata', metadataHeaders=['Subject', 'From', 'Date', 'List-Unsubscribe']
+            ).execute()
 
-            headers = msg_data["payload"].get("headers", [])
-            subject = next((h["value"] for h in headers if h["name"] == "Subject"), "")
-            from_ = next((h["value"] for h in headers if h["name"] == "From"), "")
-            date_ = next((h["value"] for h in headers if h["name"] == "Date"), "")
+            headers = extract_headers(
+                msg_data["payload"].get("headers", []), ["Subject", "From", "Date", "List-Unsubscribe"]
+            )
+            subject, from_, date_ = headers["Subject"], headers["From"], headers["Date"]
             snippet = msg_data.get("snippet", "")
 
             emails_data.append({
+                "id": msg["id"],
                 "from": from_,
                 "subject": subject,
                 "date": date_,
-                "snippet": snippet
+                "snippet": snippet,
+                "labels": msg_data.get("labelIds", []),
+                "list_unsubscribe": headers["List-Unsubscribe"]
             })
             print(f"From: {from_}\nSubject: {subject}\nDate: {date_}\n---")
 
     # Ensure data folder exists
-    os.makedirs("..\\..\\data", exist_ok=True)
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
 
     # Save results to JSON
-    output_file = f"..\\..\\data\\email_content.json"
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(emails_data, f, indent=4, ensure_ascii=False)
+    output_file = DATA_DIR / "email_content.json"
+    with open(output_file, "wb") as f:
+        f.write(orjson.dumps(emails_data, option=orjson.OPT_INDENT_2))
 
     print(f"\n Saved {len(emails_data)} emails to {output_file}")
 
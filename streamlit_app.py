@@ -7,7 +7,14 @@ checks if a reply is needed, drafts a response, and can send it.
 # streamlit_app.py
 import streamlit as st
 from langchain_core.messages import HumanMessage
-from agent import app  # Import the compiled agent graph
+
+
+@st.cache_resource
+def get_app():
+    """Import the compiled agent graph (and its Gmail client) once per server process."""
+    from agent import app
+    return app
+
 
 # --- Streamlit UI ---
 st.set_page_config(page_title="📧 Gmail AI Assistant", layout="centered")
@@ -23,14 +30,21 @@ if st.button("Run Agent"):
         # Create input for the LangGraph agent
         inputs = {"messages": [HumanMessage(content=user_query)]}
 
-        # Stream the response
+        app = get_app()
+
+        # Stream the response token by token
         response_placeholder = st.empty()
         collected_response = ""
+        last_message_id = None
 
-        for step in app.stream(inputs, stream_mode="values"):
-            message = step["messages"][-1]
-            text = getattr(message, "content", str(message))
-            collected_response += text + "\n"
+        for chunk, metadata in app.stream(inputs, stream_mode="messages"):
+            if not chunk.content:
+                continue
+            # Separate consecutive messages (model turns, tool results)
+            if chunk.id != last_message_id and collected_response:
+                collected_response += "\n\n"
+            last_message_id = chunk.id
+            collected_response += chunk.content
             response_placeholder.markdown(collected_response)
 
         st.success("Done ✅")
@@ -0,0 +1,98 @@
+import asyncio
+import os
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+# agent.py refuses to import without a key; no request reaches OpenAI here
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from my_agent import agent  # noqa: E402
+from my_agent.utils.gmail_client import load_cursor, save_cursor  # noqa: E402
+from tests.test_gmail_client import FakeGmail, added, message  # noqa: E402
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    async def aembed_query(self, text):
+        self.calls += 1
+        await asyncio.sleep(0)
+        # Different emails get unrelated (near-orthogonal) vectors
+        return np.random.default_rng(int(agent.content_hash(text), 16)).standard_normal(256).tolist()
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    """Count gated_invoke calls per system prompt and stub out embeddings and sends."""
+    calls = Counter()
+
+    async def fake_invoke(model, messages):
+        calls[messages[0].content] += 1
+        await asyncio.sleep(0.01)  # stay in flight while the other email catches up
+        return SimpleNamespace(content="YES")
+
+    monkeypatch.setattr(agent, "gated_invoke", fake_invoke)
+    monkeypatch.setattr(agent, "embeddings", FakeEmbeddings())
+    monkeypatch.setattr(agent, "send_email_tool", SimpleNamespace(invoke=lambda args: "sent"))
+    return calls
+
+
+def state(email):
+    return {"email": email, "recipient": "Alice <alice@example.com>", "subject": "Lunch"}
+
+
+def test_identical_emails_in_flight_share_one_llm_call_per_tool(llm_calls):
+    email = "Can we move lunch to 1pm tomorrow?"
+
+    results = asyncio.run(agent.process_emails([state(email), state(email)]))
+
+    assert llm_calls == {
+        agent.SUMMARY_PROMPT.messages[0].prompt.template: 1,
+        agent.CHECK_REPLY_PROMPT.messages[0].prompt.template: 1,
+        agent.REPLY_PROMPT.messages[0].prompt.template: 1,
+    }
+    assert agent.embeddings.calls == 1
+    assert [r["status"] for r in results] == ["sent", "sent"]
+
+
+def test_failed_call_is_not_cached(llm_calls, monkeypatch):
+    email = "Is the quarterly report ready?"
+
+    async def failing_invoke(model, messages):
+        raise RuntimeError("rate limited")
+
+    with monkeypatch.context() as m:
+        m.setattr(agent, "gated_invoke", failing_invoke)
+        with pytest.raises(RuntimeError):
+            asyncio.run(agent.summarize_email_tool.ainvoke({"email": email}))
+
+    assert asyncio.run(agent.summarize_email_tool.ainvoke({"email": email})) == "YES"
+
+
+def test_failed_run_leaves_the_cursor_and_records_the_rest(llm_calls, monkeypatch, tmp_path):
+    history_file = tmp_path / ".state" / "gmail_history"
+    save_cursor(history_file, "10")
+    service = FakeGmail([message("ok"), message("bad")], history=[added(11, "ok"), added(12, "bad")],
+                        latest_history_id="12")
+    monkeypatch.setattr(agent, "HISTORY_FILE", history_file)
+    monkeypatch.setattr(agent, "get_service", lambda: service)
+    counting_invoke = agent.gated_invoke
+
+    async def flaky_invoke(model, messages):
+        if "body bad" in messages[-1].content:
+            raise RuntimeError("rate limited")
+        return await counting_invoke(model, messages)
+
+    monkeypatch.setattr(agent, "gated_invoke", flaky_invoke)
+    with pytest.raises(RuntimeError):
+        asyncio.run(agent.process_unread_emails())
+    assert load_cursor(history_file) == ("10", ["ok"])
+
+    monkeypatch.setattr(agent, "gated_invoke", counting_invoke)
+    [result] = asyncio.run(agent.process_unread_emails())
+    assert result["subject"] == "bad"
+    assert load_cursor(history_file) == ("12", ["ok", "bad"])
@@ -0,0 +1,193 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from my_agent.utils.gmail_client import fetch_new_unread_messages, load_cursor, save_cursor
+
+HEADERS = ["Subject", "From", "List-Unsubscribe"]
+
+
+class FakeRequest:
+    def __init__(self, respond):
+        self.respond = respond
+
+    def execute(self):
+        return self.respond()
+
+
+class FakeBatch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request, request_id))
+
+    def execute(self):
+        for request, request_id in self.requests:
+            try:
+                response, exception = request.execute(), None
+            except HttpError as err:
+                response, exception = None, err
+            self.callback(request_id, response, exception)
+
+
+def not_found():
+    raise HttpError(httplib2.Response({"status": 404}), b"not found")
+
+
+class FakeGmail:
+    """Just enough of the Gmail service for fetch_new_unread_messages."""
+
+    def __init__(self, messages, history=None, latest_history_id="100", history_expired=False):
+        self.messages_by_id = {msg["id"]: msg for msg in messages}
+        self.history_records = history or []
+        self.latest_history_id = latest_history_id
+        self.history_expired = history_expired
+        self.listed = False
+
+    # service.users().messages() / .history() / .getProfile()
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return self
+
+    def getProfile(self, userId):
+        return FakeRequest(lambda: {"historyId": self.latest_history_id})
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(callback)
+
+    def get(self, userId, id, **params):
+        if id not in self.messages_by_id:
+            return FakeRequest(not_found)
+        return FakeRequest(lambda: self.messages_by_id[id])
+
+    def list(self, userId, **params):
+        if "startHistoryId" in params:
+            if self.history_expired:
+                return FakeRequest(not_found)
+            start = int(params["startHistoryId"])
+            records = [r for r in self.history_records if int(r["id"]) > start]
+            return FakeRequest(lambda: {"history": records, "historyId": self.latest_history_id})
+        self.listed = True
+        unread = [{"id": msg_id} for msg_id, msg in reversed(self.messages_by_id.items())
+                  if "UNREAD" in msg["labelIds"]]
+        return FakeRequest(lambda: {"messages": unread[:params["maxResults"]]})
+
+
+def message(msg_id, sender="Alice <alice@example.com>", labels=("INBOX", "UNREAD")):
+    return {
+        "id": msg_id,
+        "labelIds": list(labels),
+        "snippet": f"body {msg_id}",
+        "payload": {"headers": [{"name": "From", "value": sender}, {"name": "Subject", "value": msg_id}]},
+    }
+
+
+def added(record_id, *msg_ids):
+    return {
+        "id": str(record_id),
+        "messagesAdded": [{"message": {"id": i, "labelIds": ["INBOX", "UNREAD"]}} for i in msg_ids],
+    }
+
+
+@pytest.fixture
+def cursor_file(tmp_path):
+    return tmp_path / ".state" / "gmail_history"
+
+
+def ids(messages):
+    return [msg["id"] for msg in messages]
+
+
+def test_first_call_lists_unread_without_saving(cursor_file):
+    service = FakeGmail([message("m1"), message("m2")], latest_history_id="42")
+
+    result, cursor = fetch_new_unread_messages(service, cursor_file, 5, HEADERS)
+
+    assert ids(result) == ["m1", "m2"]
+    assert cursor == "42"
+    assert not cursor_file.exists()
+
+
+def test_history_beyond_max_results_is_returned_by_the_next_call(cursor_file):
+    cursor_file.parent.mkdir(parents=True)
+    cursor_file.write_text("10")  # plain historyId, as older versions saved it
+    new_ids = [f"m{i}" for i in range(1, 9)]
+    history = [added(10 + i, msg_id) for i, msg_id in enumerate(new_ids, start=1)]
+    service = FakeGmail([message(i) for i in new_ids], history=history, latest_history_id="18")
+
+    first, cursor = fetch_new_unread_messages(service, cursor_file, 5, HEADERS)
+    assert ids(first) == new_ids[:5]
+    assert cursor == "15"
+    save_cursor(cursor_file, cursor, ids(first))
+
+    second, cursor = fetch_new_unread_messages(service, cursor_file, 5, HEADERS)
+    assert ids(second) == new_ids[5:]
+    assert cursor == "18"
+    assert not service.listed
+
+
+def test_history_skips_read_and_automated_mail_before_capping(cursor_file):
+    save_cursor(cursor_file, "10")
+    messages = [
+        message("read", labels=("INBOX",)),  # read since it arrived
+        message("noreply", sender="Shop <noreply@shop.example>"),
+        message("promo", labels=("INBOX", "UNREAD", "CATEGORY_PROMOTIONS")),
+        message("m1"),
+        message("m2"),
+    ]
+    history = [added(11 + i, msg["id"]) for i, msg in enumerate(messages)]
+    service = FakeGmail(messages, history=history, latest_history_id="20")
+
+    result, cursor = fetch_new_unread_messages(service, cursor_file, 2, HEADERS)
+
+    assert ids(result) == ["m1", "m2"]
+    assert cursor == "20"
+
+
+def test_history_skips_messages_deleted_since_they_arrived(cursor_file):
+    save_cursor(cursor_file, "10")
+    service = FakeGmail([message("m2")], history=[added(11, "gone"), added(12, "m2")], latest_history_id="12")
+
+    result, _ = fetch_new_unread_messages(service, cursor_file, 5, HEADERS)
+
+    assert ids(result) == ["m2"]
+
+
+def test_expired_cursor_falls_back_to_listing(cursor_file):
+    save_cursor(cursor_file, "1")
+    service = FakeGmail([message("m1")], latest_history_id="99", history_expired=True)
+
+    result, cursor = fetch_new_unread_messages(service, cursor_file, 5, HEADERS)
+
+    assert ids(result) == ["m1"]
+    assert service.listed
+    assert cursor == "99"
+
+
+def test_mail_listed_after_the_profile_read_is_not_returned_twice(cursor_file):
+    # m2 arrives between getProfile and messages.list: it is listed, and is also
+    # in the history after the saved cursor
+    service = FakeGmail([message("m1"), message("m2")], history=[added(43, "m2")], latest_history_id="42")
+    first, cursor = fetch_new_unread_messages(service, cursor_file, 5, HEADERS)
+    save_cursor(cursor_file, cursor, ids(first))
+
+    service.latest_history_id = "43"
+    second, cursor = fetch_new_unread_messages(service, cursor_file, 5, HEADERS)
+
+    assert ids(first) == ["m1", "m2"]
+    assert second == []
+    assert cursor == "43"
+
+
+def test_progress_without_a_cursor_keeps_the_saved_history_id(cursor_file):
+    save_cursor(cursor_file, "10", ["m1"])
+    save_cursor(cursor_file, None, ["m2"])
+
+    assert load_cursor(cursor_file) == ("10", ["m1", "m2"])